@@ -1,9 +1,10 @@
 from utils.config import load_configuration
-from utils.db import init_database, create_appointment, get_luxmed_credentials, create_luxmed_credentials, delete_luxmed_credentials, list_user_appointments, delete_appointment
+from utils.db import init_database, create_appointment, get_luxmed_credentials, create_luxmed_credentials, delete_luxmed_credentials, list_user_appointments, delete_appointment, import_tinydb_database
 from utils.luxmedapi import LuxmedApi, LuxmedApiError
 from models import Appointment, AppointmentStatus, AppointmentQuery
 from typing import Dict
 import json
+import msgspec
 import datetime
 import click
 import getpass
@@ -11,15 +12,15 @@ import getpass
 def create_query_from_search_params(params: Dict) -> Dict:
     return {
         "name": params["searchName"],
-        "query": AppointmentQuery(
-            city_id=params["cityId"],
-            service_id=params["serviceVariantId"],
-            facilities_ids=params.get("facilitiesIds", []),
-            doctor_ids=params.get("doctorsIds", []),
-            doctor_blacklist_ids=[],
-            start_date=params["searchDateFrom"],
-            lookup_time_days=params["searchDatePreset"]
-        )
+        "query": msgspec.convert({
+            "city_id": params["cityId"],
+            "service_id": params["serviceVariantId"],
+            "facilities_ids": params.get("facilitiesIds", []),
+            "doctor_ids": params.get("doctorsIds", []),
+            "doctor_blacklist_ids": [],
+            "start_date": params["searchDateFrom"],
+            "lookup_time_days": params["searchDatePreset"]
+        }, AppointmentQuery, strict=False)
     }
 
 def get_last_search_params(account_email: str) -> Dict:
@@ -39,7 +40,7 @@ def cli(config):
 @click.argument('account_email')
 def get_last_search(account_email: str):
     last_search_params = get_last_search_params(account_email)
-    last_search_params["query"] = last_search_params["query"].model_dump()
+    last_search_params["query"] = msgspec.to_builtins(last_search_params["query"])
     print(json.dumps(last_search_params, indent=2))
 
 @cli.command()
@@ -54,7 +55,7 @@ def create_appointment_from_last_search(account_email: str):
         query=query_data["query"]
     )
     created_appointment = create_appointment(appointment)
-    print(f"Appointment created successfully:\n{json.dumps(created_appointment.model_dump(), indent=2)}")
+    print(f"Appointment created successfully:\n{json.dumps(msgspec.to_builtins(created_appointment), indent=2)}")
 
 @cli.command()
 @click.argument('account_email')
@@ -84,7 +85,7 @@ def delete_credentials(account_email: str):
 def list_users_appointments(account_email: str):
     appointments = list_user_appointments(email=account_email)
     for appointment in appointments:
-        print(json.dumps(appointment.model_dump(), indent=2))
+        print(json.dumps(msgspec.to_builtins(appointment), indent=2))
 
 @cli.command(name='delete-appointment')
 @click.argument('appointment_id')
@@ -94,5 +95,11 @@ def delete_appointment_cmd(appointment_id: str):
     else:
         print(f"Error: Appointment {appointment_id} not found.")
 
+@cli.command()
+@click.argument('tinydb_file')
+def import_tinydb(tinydb_file: str):
+    appointments_count, credentials_count = import_tinydb_database(tinydb_file)
+    print(f"Imported {appointments_count} appointments and {credentials_count} credentials from {tinydb_file}.")
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -1,9 +1,36 @@
 import logging
 import sys
+import traceback
+from typing import Optional
 import click
 from loguru import logger
 from utils.appointmentshunter import LuxmedAppointmentHunter
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def format_exception(exception) -> Optional[str]:
+    """Format the traceback of a log record, None when no exception is attached."""
+    # logger.exception() outside an except block attaches an exception with no type
+    if not exception or exception.type is None:
+        return None
+    return "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+
+def serialize_record(record) -> str:
+    """Serialize the log record with orjson instead of loguru's stdlib-json serializer."""
+    record["extra"]["serialized"] = orjson.dumps({
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "name": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        "exception": format_exception(record["exception"])
+    }).decode()
+    return "{extra[serialized]}\n"
+
 def setup_logging():
     class InterceptHandler(logging.Handler):
         def emit(self, record: logging.LogRecord) -> None:
@@ -13,7 +40,10 @@ def setup_logging():
     logging.basicConfig(handlers=[InterceptHandler()], level=logging.INFO, force=True)
     logger.remove()
     logger.add(sys.stdout, level="DEBUG")  # TODO: INFO
-    logger.add("debug.log", format="{time} - {message}", rotation="1 week", serialize=True)
+    if orjson:
+        logger.add("debug.log", format=serialize_record, rotation="1 week")
+    else:
+        logger.add("debug.log", format="{time} - {message}", rotation="1 week", serialize=True)
 
 @click.command()
 @click.option('-c', '--config', default="config.yaml", help="Configuration file path")
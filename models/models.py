@@ -2,14 +2,14 @@ import uuid
 from enum import IntEnum
 from datetime import datetime
 from typing import List, Optional, Dict
-from pydantic import BaseModel, Field
+import msgspec
 
 class AppointmentStatus(IntEnum):
     active = 1
     reserved = 2
     error = 99
 
-class AppointmentQuery(BaseModel):
+class AppointmentQuery(msgspec.Struct, kw_only=True):
     city_id: int
     service_id: int
     facilities_ids: List[int] = []
@@ -20,8 +20,8 @@ class AppointmentQuery(BaseModel):
     before_hour: Optional[str] = None
     lookup_time_days: Optional[int] = 14
 
-class Appointment(BaseModel):
-    id: str = None
+class Appointment(msgspec.Struct, kw_only=True):
+    id: Optional[str] = None
     status: AppointmentStatus
     account_email: str
     query: AppointmentQuery
@@ -31,6 +31,6 @@ class Appointment(BaseModel):
     allow_rescheduling: bool = False
     term: Optional[Dict] = None
 
-class LuxmedCredentials(BaseModel):
+class LuxmedCredentials(msgspec.Struct):
     email: str
     password: str
\ No newline at end of file
@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time as dtime
+import threading
 import time
 import traceback
 from typing import Any, Dict, List
@@ -6,7 +8,7 @@ from loguru import logger
 import schedule
 import json
 from .config import load_configuration
-from .luxmedapi import LuxmedApi
+from .luxmedapi import LuxmedApi, LuxmedApiError
 from .mail import MailHandler
 from .db import *
 
@@ -14,11 +16,43 @@ class LuxmedAppointmentHunterError(Exception):
     """Custom Exception for LuxMedAppointmentHunter errors."""
     pass
 
+def _to_jsonable(obj: Any) -> Any:
+    """Convert an API term into JSON-native types, stringifying the rest like json.dumps(default=str)."""
+    if isinstance(obj, dict):
+        return {key: _to_jsonable(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(value) for value in obj]
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+def _parse_query_date(value: str) -> datetime:
+    """Parse a query date, accepting the non-padded forms strptime allows, e.g. 2026-5-1."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d")
+
+def _parse_query_hour(value: str) -> dtime:
+    """Parse a query hour, accepting the non-padded forms strptime allows, e.g. 9:00."""
+    try:
+        return dtime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%H:%M").time()
+
 class LuxmedAppointmentHunter:
     def __init__(self, config_file: str):
         logger.info("Initializing LuxMedAppointmentHunter.")
         self.config = load_configuration(config_file)
         self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.account_locks = {}
+        self.login_failures = {}
+        # Worker threads are kept for the lifetime of the hunter and reused by every cycle
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.get('hunter_workers', 8),
+            thread_name_prefix="hunter"
+        )
 
         # init database
         init_database(self.config['database_file'])
@@ -31,9 +65,9 @@ class LuxmedAppointmentHunter:
     def _get_appointments_terms(self, session, params) -> List[Dict]:
         """Fetch and filter appointments based on configuration."""
 
-        date_from = datetime.strptime(params.start_date, "%Y-%m-%d") if params.start_date else datetime.today()
-        before_hour = datetime.strptime(params.before_hour, "%H:%M").time() if params.before_hour else None
-        after_hour = datetime.strptime(params.after_hour, "%H:%M").time() if params.after_hour else None
+        date_from = _parse_query_date(params.start_date) if params.start_date else datetime.today()
+        before_hour = _parse_query_hour(params.before_hour) if params.before_hour else None
+        after_hour = _parse_query_hour(params.after_hour) if params.after_hour else None
 
         params = {
             "city_id": params.city_id,
@@ -54,70 +88,103 @@ class LuxmedAppointmentHunter:
         if self.config['notifications']['mail']['enable']:
             self.mail.send_mail(subject, message)
 
+    def _get_account_lock(self, account_email: str) -> threading.Lock:
+        """Return the lock serializing logins and reservations of a single account."""
+        with self.sessions_lock:
+            return self.account_locks.setdefault(account_email, threading.Lock())
+
     def _get_session(self, account_email: str):
-        if account_email not in self.sessions:
+        with self.sessions_lock:
+            session = self.sessions.get(account_email)
+
+        if session is not None:
+            return session
+
+        # Log in once per account even if several workers need the session at once
+        with self._get_account_lock(account_email):
+            with self.sessions_lock:
+                session = self.sessions.get(account_email)
+            if session is not None:
+                return session
+
+            # Don't repeat a failed login for every appointment of the same account
+            if account_email in self.login_failures:
+                raise self.login_failures[account_email]
             credentials = get_luxmed_credentials(email = account_email)
             if not credentials:
                 raise Exception("Luxmed account not found in the database")
-            session = LuxmedApi(email=credentials.email, password=credentials.password)
-            self.sessions[account_email] = session
-
-        return self.sessions[account_email]
+            try:
+                session = LuxmedApi(email=credentials.email, password=credentials.password)
+            except LuxmedApiError as e:
+                self.login_failures[account_email] = e
+                raise
+            with self.sessions_lock:
+                self.sessions[account_email] = session
+
+        return session
+
+    def _process_appointment(self, appointment: Appointment):
+        """Check a single appointment and attempt to reserve the first available term."""
+        try:
+            logger.info(f"Checking {appointment.id} ({appointment.account_email}, {appointment.comment})...")
+            session = self._get_session(appointment.account_email)
+            # Term searches of one account run concurrently, reservations are made one at a time
+            terms = self._get_appointments_terms(session, appointment.query)
+
+            if terms:
+                with self._get_account_lock(appointment.account_email):
+                    # Attempt to reserve the first available appointment
+                    term = terms[0]
+                    lock = session.create_reservation_lock_term(term)
+
+                    # Check related visits
+                    related_visits = lock.get('relatedVisits', [])
+
+                    if len(related_visits):
+                        # Check is allowing rescheduling
+                        if not appointment.allow_rescheduling:
+                            logger.error(f"Appointment {appointment.id} ({appointment.comment}) have already scheduled visit and is not allowed to rescheduled. Changing appointment status to ERROR.")
+                            appointment.status = AppointmentStatus.error
+                            appointment.next_check = 0
+                            update_appointment(appointment.id, appointment)
+                            return
+                        # Reschedule reservation term
+                        reservation = session.change_reservation(term, lock)
+                    else: # Create reservation
+                        reservation = session.create_reservation(term, lock)
+
+                    appointment.status = AppointmentStatus.reserved
+                    appointment.next_check = 0
+                    appointment.term = _to_jsonable(term)
+                    update_appointment(appointment.id, appointment)
+
+                    self._send_notification(
+                        subject="Appointment Reserved",
+                        message=f"Reserved appointment:\n{json.dumps(appointment.term, indent=2)}"
+                    )
+                    logger.info(
+                        "Reserved appointment term: {dateTimeFrom} at {clinic} - {doctorName}", 
+                        **term
+                    )
+            else:
+                next_check = datetime.now() + timedelta(seconds=appointment.check_frequency)
+                appointment.next_check = int(next_check.timestamp())
+                update_appointment(appointment.id, appointment)
+                logger.info(f"No terms found for appointment {appointment.id} ({appointment.comment}). Next check at {next_check}... ")
+        except Exception as e:
+            logger.error("Error reserving appointment: {}", e, exc_info=True)
+            logger.debug(traceback.format_exc())
 
     def hunt_appointments(self):
         """Hunt for appointments and attempt to reserve them."""
         try:
             appointments = get_appointments_to_check()
             logger.info(f"Found {len(appointments)} appointments to check")
+            self.login_failures.clear()
 
-            for appointment in appointments:
-                try:
-                    logger.info(f"Checking {appointment.id} ({appointment.account_email}, {appointment.comment})...")
-                    session = self._get_session(appointment.account_email)
-                    terms = self._get_appointments_terms(session, appointment.query)
-
-                    if terms:
-                        # Attempt to reserve the first available appointment
-                        term = terms[0]
-                        lock = session.create_reservation_lock_term(term)
-
-                        # Check related visits
-                        related_visits = lock.get('relatedVisits', [])
-
-                        if len(related_visits):
-                            # Check is allowing rescheduling
-                            if not appointment.allow_rescheduling:
-                                logger.error(f"Appointment {appointment.id} ({appointment.comment}) have already scheduled visit and is not allowed to rescheduled. Changing appointment status to ERROR.")
-                                appointment.status = AppointmentStatus.error
-                                appointment.next_check = 0
-                                update_appointment(appointment.id, appointment)
-                                continue
-                            # Reschedule reservation term
-                            reservation = session.change_reservation(term, lock)
-                        else: # Create reservation
-                            reservation = session.create_reservation(term, lock)
-
-                        appointment.status = AppointmentStatus.reserved
-                        appointment.next_check = 0
-                        appointment.term = json.loads(json.dumps(term, default=str))
-                        update_appointment(appointment.id, appointment)
-
-                        self._send_notification(
-                            subject="Appointment Reserved",
-                            message=f"Reserved appointment:\n{json.dumps(term, default=str, indent=2)}"
-                        )
-                        logger.info(
-                            "Reserved appointment term: {dateTimeFrom} at {clinic} - {doctorName}", 
-                            **term
-                        )
-                    else:
-                        next_check = datetime.now() + timedelta(seconds=appointment.check_frequency)
-                        appointment.next_check = int(next_check.timestamp())
-                        update_appointment(appointment.id, appointment)
-                        logger.info(f"No terms found for appointment {appointment.id} ({appointment.comment}). Next check at {next_check}... ")
-                except Exception as e:
-                    logger.error("Error reserving appointment: {}", e, exc_info=True)
-                    logger.debug(traceback.format_exc())
+            # Each check is independent network I/O, so run them concurrently
+            # and wait until the whole batch is done
+            list(self.executor.map(self._process_appointment, appointments))
         except Exception as e:
             logger.error("Error hunting appointments: {}", e, exc_info=True)
             logger.debug(traceback.format_exc())
@@ -127,5 +194,7 @@ class LuxmedAppointmentHunter:
         self.hunt_appointments()
         schedule.every(interval).seconds.do(self.hunt_appointments)
         while True:
-            schedule.run_pending()
-            time.sleep(1)
\ No newline at end of file
+            # Sleep straight until the next job instead of waking up every second
+            idle = schedule.idle_seconds()
+            time.sleep(max(1, idle if idle is not None else 60))
+            schedule.run_pending()
\ No newline at end of file
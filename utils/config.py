@@ -2,9 +2,14 @@ import pathlib
 import yaml
 from typing import Any, Dict, List
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 def load_configuration(config_file: str) -> Dict[str, Any]:
     """Load and merge configurations from multiple YAML files."""
     config = {}
     with pathlib.Path(config_file).expanduser().open(encoding="utf-8") as stream:
-        config = yaml.safe_load(stream)
+        config = yaml.load(stream, Loader=SafeLoader)
     return config
\ No newline at end of file
@@ -1,66 +1,203 @@
-from tinydb import TinyDB, Query
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from models import Appointment, AppointmentStatus, LuxmedCredentials
-from datetime import datetime
-from uuid import uuid4
+from functools import wraps
+from uuid import UUID, uuid4
+import json
+import os
+import msgspec
+import sqlite3
+import threading
+import time
 
-# Initialize TinyDB database connection
+# Initialize SQLite database connection
 db = None
-appointments_table = None
-luxmed_credentials_table = None
 
-# Initialize TinyDB database connection
+# The connection is shared by the hunter worker threads
+_lock = threading.RLock()
+
+# Credentials looked up recently, by email, with the time they were read. Other
+# processes (the CLI) may change credentials, so entries expire after a while.
+CREDENTIALS_CACHE_TTL = 60
+_credentials_cache: Dict[str, Tuple[float, LuxmedCredentials]] = {}
+
+# Partial index on appointments that still need checking; the status is inlined so
+# the query planner can match the index condition
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS appointments (
+    id BLOB PRIMARY KEY,
+    account_email TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    next_check INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_appointments_next_check ON appointments (next_check)
+    WHERE status != {AppointmentStatus.reserved:d};
+CREATE INDEX IF NOT EXISTS ix_appointments_account_email ON appointments (account_email);
+CREATE TABLE IF NOT EXISTS luxmed_credentials (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+class DatabaseError(Exception):
+    """Custom Exception for database errors."""
+    pass
+
+def _is_tinydb_file(database_path) -> bool:
+    """Check whether the path holds a TinyDB JSON database used by older versions."""
+    if not os.path.isfile(database_path):
+        return False
+    with open(database_path, "rb") as stream:
+        return stream.read(64).lstrip().startswith(b"{")
+
+def _synchronized(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+def _id_key(appointment_id: str) -> Optional[bytes]:
+    """Convert an appointment id to the 16-byte key stored in the database."""
+    try:
+        return UUID(appointment_id).bytes
+    except (TypeError, ValueError):
+        return None
+
+def _encode_appointment(appointment: Appointment) -> str:
+    return msgspec.json.encode(appointment).decode()
+
+def _decode_appointment(data: str) -> Appointment:
+    return msgspec.json.decode(data, type=Appointment)
+
+def _appointment_row(appointment: Appointment) -> Tuple:
+    return (_id_key(appointment.id), appointment.account_email, appointment.status, appointment.next_check, _encode_appointment(appointment))
+
+# Initialize SQLite database connection
+@_synchronized
 def init_database(database_path):
-    global db, appointments_table, luxmed_credentials_table
-    db = TinyDB(database_path)
-    appointments_table = db.table('appointments')
-    luxmed_credentials_table = db.table('luxmed_credentials')
+    global db
+    if _is_tinydb_file(database_path):
+        raise DatabaseError(
+            f"{database_path} is a TinyDB database used by older versions. Set database_file in the config "
+            f"to a new file, e.g. database.db, and import the old data with: python cli.py import-tinydb {database_path}"
+        )
+    db = sqlite3.connect(database_path, isolation_level=None, check_same_thread=False)
+    db.executescript(SCHEMA)
+    _credentials_cache.clear()
 
+@_synchronized
 def list_appointments() -> List[Appointment]:
-    return [Appointment(**row) for row in appointments_table.all()]
+    rows = db.execute("SELECT data FROM appointments")
+    return [_decode_appointment(data) for data, in rows]
 
+@_synchronized
 def list_user_appointments(email: str) -> List[Appointment]:
-    AppointmentQuery = Query()
-    results = appointments_table.search(AppointmentQuery.account_email == email)
-    return [Appointment(**row) for row in results]
+    rows = db.execute("SELECT data FROM appointments WHERE account_email = ?", (email,))
+    return [_decode_appointment(data) for data, in rows]
 
+@_synchronized
 def get_appointments_to_check() -> List[Appointment]:
-    AppointmentQuery = Query()
-    results = appointments_table.search((AppointmentQuery.status != AppointmentStatus.reserved) \
-                                        & (AppointmentQuery.next_check < datetime.now().timestamp()))
-    return [Appointment(**row) for row in results]
+    rows = db.execute(
+        f"SELECT data FROM appointments WHERE status != {AppointmentStatus.reserved:d} "
+        "AND next_check < CAST(strftime('%s', 'now') AS INTEGER)"
+    )
+    return [_decode_appointment(data) for data, in rows]
+
+@_synchronized
+def create_appointments(appointments: List[Appointment]) -> List[Appointment]:
+    """Insert appointments in a single transaction, assigning ids to those without a valid one."""
+    for appointment in appointments:
+        if _id_key(appointment.id) is None:
+            appointment.id = str(uuid4())
+    with db:
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO appointments (id, account_email, status, next_check, data) VALUES (?, ?, ?, ?, ?)",
+            [_appointment_row(appointment) for appointment in appointments]
+        )
+    return appointments
 
+@_synchronized
 def create_appointment(appointment: Appointment) -> Appointment:
     appointment.id = str(uuid4())
-    result = appointments_table.insert(appointment.model_dump())
-    return get_appointment(appointment.id) if result else None
+    return create_appointments([appointment])[0]
 
+@_synchronized
 def get_appointment(appointment_id: str) -> Optional[Appointment]:
-    AppointmentQuery = Query()
-    result = appointments_table.get(AppointmentQuery.id == appointment_id)
-    return Appointment(**result) if result else None
+    key = _id_key(appointment_id)
+    if key is None:
+        return None
+    row = db.execute("SELECT data FROM appointments WHERE id = ?", (key,)).fetchone()
+    return _decode_appointment(row[0]) if row else None
 
+@_synchronized
 def update_appointment(appointment_id: str, appointment: Appointment) -> Optional[Appointment]:
-    AppointmentQuery = Query()
-    result = appointments_table.update(appointment.model_dump(), AppointmentQuery.id == appointment_id)
-    return get_appointment(appointment_id) if result else None
+    key = _id_key(appointment_id)
+    if key is None:
+        return None
+    cursor = db.execute(
+        "UPDATE appointments SET account_email = ?, status = ?, next_check = ?, data = ? WHERE id = ?",
+        (appointment.account_email, appointment.status, appointment.next_check, _encode_appointment(appointment), key)
+    )
+    return appointment if cursor.rowcount else None
 
+@_synchronized
 def delete_appointment(appointment_id: str) -> bool:
-    AppointmentQuery = Query()
-    result = appointments_table.remove(AppointmentQuery.id == appointment_id)
-    return bool(result)
+    key = _id_key(appointment_id)
+    if key is None:
+        return False
+    cursor = db.execute("DELETE FROM appointments WHERE id = ?", (key,))
+    return cursor.rowcount > 0
 
+# Credentials change rarely and are looked up for every new session or CLI command.
+# Missing accounts are not cached, so credentials added later are found right away.
+@_synchronized
 def get_luxmed_credentials(email: str) -> Optional[LuxmedCredentials]:
-    Credentails = Query()
-    result = luxmed_credentials_table.get(Credentails.email == email)
-    return LuxmedCredentials(**result) if result else None
+    cached = _credentials_cache.get(email)
+    if cached and time.monotonic() - cached[0] < CREDENTIALS_CACHE_TTL:
+        return cached[1]
+    row = db.execute("SELECT email, password FROM luxmed_credentials WHERE email = ?", (email,)).fetchone()
+    if not row:
+        _credentials_cache.pop(email, None)
+        return None
+    credentials = LuxmedCredentials(*row)
+    _credentials_cache[email] = (time.monotonic(), credentials)
+    return credentials
 
+@_synchronized
 def create_luxmed_credentials(email: str, password: str) -> LuxmedCredentials:
-    credentials = { "email": email, "password": password }
-    luxmed_credentials_table.insert(credentials)
-    return LuxmedCredentials(**credentials)
+    db.execute("INSERT INTO luxmed_credentials (email, password) VALUES (?, ?)", (email, password))
+    _credentials_cache.clear()
+    return LuxmedCredentials(email=email, password=password)
 
+@_synchronized
 def delete_luxmed_credentials(email: str) -> bool:
-    Credentials = Query()
-    result = luxmed_credentials_table.remove(Credentials.email == email)
-    return bool(result)
\ No newline at end of file
+    cursor = db.execute("DELETE FROM luxmed_credentials WHERE email = ?", (email,))
+    _credentials_cache.clear()
+    return cursor.rowcount > 0
+
+@_synchronized
+def import_tinydb_database(tinydb_path: str) -> Tuple[int, int]:
+    """Copy appointments and credentials from a TinyDB JSON database used by older versions."""
+    with open(tinydb_path, encoding="utf-8") as stream:
+        tables = json.load(stream)
+
+    appointments = [msgspec.convert(row, Appointment) for row in tables.get("appointments", {}).values()]
+    credentials = [msgspec.convert(row, LuxmedCredentials) for row in tables.get("luxmed_credentials", {}).values()]
+    for appointment in appointments:
+        if _id_key(appointment.id) is None:
+            appointment.id = str(uuid4())
+
+    with db:
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT OR REPLACE INTO appointments (id, account_email, status, next_check, data) VALUES (?, ?, ?, ?, ?)",
+            [_appointment_row(appointment) for appointment in appointments]
+        )
+        db.executemany(
+            "INSERT OR REPLACE INTO luxmed_credentials (email, password) VALUES (?, ?)",
+            [(c.email, c.password) for c in credentials]
+        )
+    _credentials_cache.clear()
+    return len(appointments), len(credentials)
@@ -1,27 +1,101 @@
 import datetime
+import itertools
 import json
+import re
+import threading
+import time
 import requests
 import jwt
+from functools import lru_cache, wraps
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, List
 from loguru import logger
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+def _as_builtin(value):
+    """Convert a lazy simdjson proxy into plain Python objects."""
+    if simdjson is not None:
+        if isinstance(value, simdjson.Object):
+            return value.as_dict()
+        if isinstance(value, simdjson.Array):
+            return value.as_list()
+    return value
+
+# Byte patterns used to detect an empty search response without decoding it.
+# EMPTY_TERMS_PATTERN only skips flat members of termsForService, so it can't match
+# a termsForDays list nested elsewhere. ERRORS_PATTERN matches any errors value
+# other than [] or null; anything it matches is parsed and checked properly.
+EMPTY_TERMS_PATTERN = re.compile(rb'"termsForService"\s*:\s*\{[^{}\[\]]*?"termsForDays"\s*:\s*\[\s*\]')
+ERRORS_PATTERN = re.compile(rb'"errors"\s*:\s*(?!\[\s*\]|null\b)')
+
 class LuxmedApiError(Exception):
     """Custom Exception for LuxMedApi errors."""
     pass
 
-def decode_jwt_expiration(token: str) -> datetime.datetime:
+@lru_cache(maxsize=8)
+def decode_jwt_expiration(token: str) -> float:
+    """Return the token expiration as a unix timestamp."""
     try:
         # Decode the JWT without verification (use with trusted tokens only)
         decoded_token = jwt.decode(token, options={"verify_signature": False})
         exp_timestamp = decoded_token.get("exp")
         if not exp_timestamp:
             raise LuxmedApiError("Token does not contain an expiration date.")
-        
-        # Convert the expiration timestamp to a datetime object
-        return datetime.datetime.fromtimestamp(exp_timestamp, tz=datetime.timezone.utc)
+
+        return float(exp_timestamp)
     except jwt.PyJWTError as e:
         raise LuxmedApiError(f"Failed to decode JWT token: {e}")
 
+def _iso_utc(dt: datetime.datetime) -> str:
+    """Format a datetime as the UTC timestamp expected by the reservation endpoints."""
+    u = dt.astimezone(datetime.timezone.utc)
+    return f"{u.year:04d}-{u.month:02d}-{u.day:02d}T{u.hour:02d}:{u.minute:02d}:{u.second:02d}.000Z"
+
+def _hhmm(dt: datetime.datetime) -> str:
+    return f"{dt.hour:02d}:{dt.minute:02d}"
+
+@lru_cache(maxsize=256)
+def _join_ids(ids: tuple) -> str:
+    """Serialize an id filter once, the same appointment is polled with the same ids."""
+    return ",".join(map(str, ids))
+
+def with_auto_reauth(func):
+    """Retry a request once after logging in again when the portal answers 401 or 403."""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (401, 403):
+                raise
+            logger.info("Request rejected with {}. Reauthenticating...", e.response.status_code)
+            # A 403 may mean a stale XSRF token, so fetch a new one as well
+            force_refresh = e.response.status_code == 403
+            sent = e.response.request.headers if e.response.request is not None else {}
+            rejected = ("Authorization-Token", "XSRF-TOKEN") if force_refresh else ("Authorization-Token",)
+            self.refresh(
+                force_refresh=force_refresh,
+                rejected_headers={name: sent.get(name) for name in rejected}
+            )
+            return func(self, *args, **kwargs)
+    return wrapper
+
 class LuxmedApi:
     LUXMED_LOGIN_URL = 'https://portalpacjenta.luxmed.pl/PatientPortal/Account/LogIn'
     GET_USER_URL = 'https://portalpacjenta.luxmed.pl/PatientPortal/NewPortal/UserProfile/GetUser'
@@ -31,33 +105,54 @@ class LuxmedApi:
     RESERVATION_CONFIRM_URL = "https://portalpacjenta.luxmed.pl/PatientPortal/NewPortal/reservation/confirm"
     RESERVATION_CHANGE_TERM_URL = "https://portalpacjenta.luxmed.pl/PatientPortal/NewPortal/reservation/changeterm"
     RECENT_SEARCH_TERMS_URL = 'https://portalpacjenta.luxmed.pl/PatientPortal/NewPortal/RecentSearchTermsParameters/recentSearchData'
+    # Reauthenticate slightly before the token actually expires [s]
+    TOKEN_EXPIRATION_SKEW = 30
 
     def __init__(self, email, password):
         logger.info("Initializing LuxMedApi.")
         self.email = email
         self.password = password
-        self.token_expiration = None
+        self._token_exp_ts = None
+        # One instance is shared by the hunter workers checking the same account
+        self._auth_lock = threading.RLock()
+        self._local = threading.local()
 
         self.session = self._create_session()
         self._authenticate()
         
     def _create_session(self) -> requests.Session:
         session = requests.Session()
+        # Keep connections to the portal alive between polls and retry transient
+        # gateway errors. Only idempotent methods are retried, so a reservation
+        # POST is never sent twice.
+        adapter = HTTPAdapter(
+            # All traffic goes to a single host; the larger per-host pool lets
+            # concurrent checks keep their own connections warm
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+        )
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        session.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
         return session
 
-    def _authenticate(self):
-        """Perform login and store authorization token."""
+    def _authenticate(self, force_refresh: bool = False):
+        """Perform login and store authorization token.
+
+        The XSRF token is kept across logins unless force_refresh is set.
+        """
         payload = {
             "login": self.email,
             "password": self.password,
         }
 
-        response = self.session.post(self.LUXMED_LOGIN_URL, json=payload, headers={"Content-Type": "application/json"})
+        response = self.session.post(self.LUXMED_LOGIN_URL, data=_dumps(payload))
         
         if response.status_code != 200:
             raise LuxmedApiError(f"Login failed: {response.text}")
         
-        response_data = response.json()
+        response_data = _loads(response.content)
         if not response_data.get("succeded", True):
             raise LuxmedApiError(f"Login failed: {response_data.get('errorMessage', 'Unknown error')}")
        
@@ -66,18 +161,20 @@ class LuxmedApi:
             raise LuxmedApiError("Login failed: Token not received.")
         
         self.session.headers["Authorization-Token"] = f"Bearer {token}"
-        self._get_xsrf_token()
+        if force_refresh or self.session.headers.get("XSRF-TOKEN") is None:
+            self._get_xsrf_token()
         logger.info("Login successful.")
 
         # Decode JWT token and extract expiration date
-        self.token_expiration = decode_jwt_expiration(token)
-        logger.info(f"Token expiration date: {self.token_expiration}")
+        token_expiration = decode_jwt_expiration(token)
+        self._token_exp_ts = token_expiration - self.TOKEN_EXPIRATION_SKEW
+        logger.info(f"Token expiration date: {datetime.datetime.fromtimestamp(token_expiration, tz=datetime.timezone.utc)}")
 
     def _get_xsrf_token(self):
         """Retrieve XSRF token and update session headers."""
         response = self.session.get(self.GET_FORGERY_TOKEN_URL)
         response.raise_for_status()
-        token = response.json().get("token")
+        token = _loads(response.content).get("token")
         if not token:
             raise LuxmedApiError("Failed to retrieve XSRF token.")
         
@@ -86,23 +183,53 @@ class LuxmedApi:
     
     def _ensure_authenticated(self):
         """Check if the token is expired and reauthenticate if necessary."""
-        if not self.token_expiration or datetime.datetime.now(datetime.timezone.utc) >= self.token_expiration:
-            logger.info("Token expired or not available. Reauthenticating...")
-            self._authenticate()
+        if self._token_exp_ts is None or time.time() >= self._token_exp_ts:
+            with self._auth_lock:
+                # Another worker may have logged in while we were waiting
+                if self._token_exp_ts is None or time.time() >= self._token_exp_ts:
+                    logger.info("Token expired or not available. Reauthenticating...")
+                    self._authenticate()
 
-    def _get(self, url: str, **kwargs) -> dict:
-        """Make a GET request, ensuring the token is valid."""
+    def refresh(self, force_refresh: bool = False, rejected_headers: Dict[str, str] = None):
+        """Log in again, keeping the same session and its open connections.
+
+        When rejected_headers are given, the login is skipped if the session no longer
+        sends any of them, i.e. another worker has already logged in again.
+        """
+        with self._auth_lock:
+            if rejected_headers and all(self.session.headers.get(name) != value for name, value in rejected_headers.items()):
+                return
+            self._authenticate(force_refresh=force_refresh)
+
+    def _get_parser(self):
+        """Return the simdjson parser of the current thread, parsers can't be shared between threads."""
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = self._local.parser = simdjson.Parser()
+        return parser
+
+    @with_auto_reauth
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Make a request, ensuring the token is valid."""
         self._ensure_authenticated()
-        response = self.session.get(url, **kwargs)
+        response = self.session.request(method, url, **kwargs)
         response.raise_for_status()
-        return response.json()
+        return response
+
+    def _get_content(self, url: str, **kwargs) -> bytes:
+        """Make a GET request, ensuring the token is valid, and return the raw body."""
+        return self._request("GET", url, **kwargs).content
+
+    def _get(self, url: str, **kwargs) -> dict:
+        """Make a GET request, ensuring the token is valid."""
+        return _loads(self._get_content(url, **kwargs))
 
     def _post(self, url: str, **kwargs) -> dict:
         """Make a POST request, ensuring the token is valid."""
-        self._ensure_authenticated()
-        response = self.session.post(url, **kwargs)
-        response.raise_for_status()
-        return response.json()
+        if "json" in kwargs:
+            # Serialize the body with orjson; the session already sends the JSON Content-Type
+            kwargs["data"] = _dumps(kwargs.pop("json"))
+        return _loads(self._request("POST", url, **kwargs).content)
 
     def _parse_visits(
             self, data: dict, clinic_ids: List[int], doctor_ids: List[int], 
@@ -112,37 +239,55 @@ class LuxmedApi:
             ) -> List[Dict]:
         """Parse available appointment terms from the response data."""
         appointments = []
+        correlation_id = data['correlationId']
+        doctor_ids = frozenset(doctor_ids)
+        doctor_blacklist_ids = frozenset(doctor_blacklist_ids)
+        clinic_ids = frozenset(clinic_ids)
+        date_from_ts = date_from.timestamp() if date_from else None
+        date_to_ts = date_to.timestamp() if date_to else None
+        # Hot loop, keep everything it touches in locals
+        from_iso = datetime.datetime.fromisoformat
+        append = appointments.append
+        terms = itertools.chain.from_iterable(
+            day_terms["terms"] for day_terms in data["termsForService"]["termsForDays"]
+        )
+
+        for term in terms:
+            # Cheap id filters first, the date is parsed only for terms that pass them
+            doctor_id = term['doctor']["id"]
+            if doctor_ids and doctor_id not in doctor_ids:
+                continue
+            if doctor_blacklist_ids and doctor_id in doctor_blacklist_ids:
+                continue
+            if clinic_ids and term["clinicGroupId"] not in clinic_ids:
+                continue
+            term_datetime_from = from_iso(term['dateTimeFrom'])
+            term_timestamp_from = term_datetime_from.timestamp()
+            if date_from_ts is not None and term_timestamp_from < date_from_ts:
+                continue
+            if date_to_ts is not None and term_timestamp_from > date_to_ts:
+                continue
+            term_datetime_from = term_datetime_from.astimezone()
+            if before_hour and term_datetime_from.time() > before_hour:
+                continue
+            if after_hour and term_datetime_from.time() < after_hour:
+                continue
 
-        for day_terms in data["termsForService"]["termsForDays"]:
-            for term in day_terms["terms"]:
-                term_datetime_from = datetime.datetime.fromisoformat(term['dateTimeFrom']).astimezone()
-                if doctor_ids and term['doctor']["id"] not in doctor_ids:
-                    continue
-                if doctor_blacklist_ids and term['doctor']["id"] in doctor_blacklist_ids:
-                    continue
-                if clinic_ids and term["clinicGroupId"] not in clinic_ids:
-                    continue
-                if date_from and term_datetime_from < date_from.astimezone():
-                    continue
-                if date_to and term_datetime_from > date_to.astimezone():
-                    continue
-                if before_hour and term_datetime_from.time() > before_hour:
-                    continue
-                if after_hour and term_datetime_from.time() < after_hour:
-                    continue
-
-                term.update({
-                    "correlationId": data['correlationId'],
-                    "dateTimeFrom": term_datetime_from,
-                    "dateTimeTo": datetime.datetime.fromisoformat(term['dateTimeTo']).astimezone(),
-                    "doctorName": f'{term["doctor"]["academicTitle"]} {term["doctor"]["firstName"]} {term["doctor"]["lastName"]}'
-                })
-                appointments.append(term)
+            # Only terms that passed the filters are materialized
+            term = _as_builtin(term)
+            doctor = term["doctor"]
+            term.update({
+                "correlationId": correlation_id,
+                "dateTimeFrom": term_datetime_from,
+                "dateTimeTo": from_iso(term['dateTimeTo']).astimezone(),
+                "doctorName": f'{doctor["academicTitle"]} {doctor["firstName"]} {doctor["lastName"]}'
+            })
+            append(term)
         return appointments    
 
     def get_user_info(self) -> dict:
         """Get a information about user"""
-        return self._get(url=self.GET_USER_URL, headers={"Content-Type": "application/json"})
+        return self._get(url=self.GET_USER_URL)
 
     def get_appointments_terms(self, city_id: int, service_id: int, facilities_ids: List[int] = [],
                                 doctor_ids: List[int] = [], doctor_blacklist_ids: List[int] = [],
@@ -159,86 +304,91 @@ class LuxmedApi:
             "searchPlace.type": 0,
             "serviceVariantId": service_id,
             "languageId": language_id,
-            "searchDateFrom": date_from.strftime("%Y-%m-%d"),
-            "searchDateTo": date_to.strftime("%Y-%m-%d"),
+            "searchDateFrom": date_from.date().isoformat(),
+            "searchDateTo": date_to.date().isoformat(),
             "searchDatePreset": lookup_days,
             "delocalized": False
         }
-        
+
         if facilities_ids:
-            params["facilitiesIds"] = ",".join(map(str, facilities_ids))
+            params["facilitiesIds"] = _join_ids(tuple(facilities_ids))
 
         if doctor_ids:
-            params["doctorsIds"] = ",".join(map(str, doctor_ids))
+            params["doctorsIds"] = _join_ids(tuple(doctor_ids))
 
-        visits = self._get(self.RESERVATION_SEARCH_URL, params=params)
+        content = self._get_content(self.RESERVATION_SEARCH_URL, params=params)
+        # Most polls find nothing, skip decoding when there are neither terms nor errors
+        if EMPTY_TERMS_PATTERN.search(content) and not ERRORS_PATTERN.search(content):
+            return []
+
+        # The search response is large but only a few fields per term are read,
+        # so parse it lazily with simdjson when available.
+        visits = self._get_parser().parse(content) if simdjson is not None else _loads(content)
 
         if visits.get("errors"):
             raise LuxmedApiError(
-                f"Unexpected error during term lock: {json.dumps(visits['errors'])}"
+                f"Unexpected error during term lock: {_dumps(_as_builtin(visits['errors'])).decode()}"
             )
 
-        return [
-            appointment for appointment \
-                in self._parse_visits(
-                    visits, 
-                    facilities_ids, 
-                    doctor_ids,
-                    doctor_blacklist_ids,
-                    date_from,
-                    date_to,
-                    before_hour,
-                    after_hour
-                )
-        ]
+        return self._parse_visits(
+            visits,
+            facilities_ids,
+            doctor_ids,
+            doctor_blacklist_ids,
+            date_from,
+            date_to,
+            before_hour,
+            after_hour
+        )
 
     def create_reservation_lock_term(self, appointment: dict) -> dict:
         """Lock a term for reservation."""
-        date = appointment["dateTimeFrom"] \
-            .astimezone(datetime.timezone.utc) \
-            .strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        
+        date = _iso_utc(appointment["dateTimeFrom"])
+
         params = {
             "serviceVariantId": appointment["serviceId"],
             "facilityId": appointment["clinicId"],
             "roomId": appointment["roomId"],
             "scheduleId": appointment["scheduleId"],
             "date": date,
-            "timeFrom": appointment["dateTimeFrom"].strftime("%H:%M"),
-            "timeTo": appointment["dateTimeTo"].strftime("%H:%M"),
+            "timeFrom": _hhmm(appointment["dateTimeFrom"]),
+            "timeTo": _hhmm(appointment["dateTimeTo"]),
             "doctorId": appointment["doctor"]["id"],
         }
 
         reservation_lock = self._post(
             url=self.RESERVATION_LOCK_TERM_URL,
             json=params,
-            headers={"Content-Type": "application/json"},
         )
 
         if reservation_lock.get("errors"):
             raise LuxmedApiError(
-                f"Unexpected error during term lock: {json.dumps(reservation_lock['errors'])}"
+                f"Unexpected error during term lock: {_dumps(reservation_lock['errors']).decode()}"
             )
 
         logger.info("Term locked successfully for reservation.")
         return reservation_lock["value"]
 
-    def create_reservation(self, appointment: Dict, lock: Dict) -> Dict:
-        """Create reservation for the given appointment."""
-        payload = {
+    def _base_term_payload(self, appointment: Dict, lock: Dict) -> Dict:
+        """Build the term payload shared by reservation confirm and change."""
+        return {
             "serviceVariantId": appointment['serviceId'],
             "facilityId": appointment['clinicId'],
             "roomId": appointment['roomId'],
             "scheduleId": appointment['scheduleId'],
-            "date": appointment['dateTimeFrom'].astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-            "timeFrom": appointment['dateTimeFrom'].strftime("%H:%M"),
+            "date": _iso_utc(appointment['dateTimeFrom']),
+            "timeFrom": _hhmm(appointment['dateTimeFrom']),
             "doctorId": appointment['doctor']['id'],
             "temporaryReservationId": lock['temporaryReservationId'],
             "valuation": lock['valuations'][0],
             "referralRequired": False
         }
 
-        reservation = self._post(self.RESERVATION_CONFIRM_URL, json=payload, headers={"Content-Type": "application/json"})
+    def create_reservation(self, appointment: Dict, lock: Dict) -> Dict:
+        """Create reservation for the given appointment."""
+        payload = self._base_term_payload(appointment, lock)
+
+        reservation = self._post(self.RESERVATION_CONFIRM_URL, json=payload)
     
         if reservation.get("errors"):
             raise LuxmedApiError(f"Error in reservation creation: {reservation['errors']}")
@@ -252,24 +402,14 @@ class LuxmedApi:
         if not len(related_visits):
             raise LuxmedApiError(f"Error in reservation change: lock does not have related. Lock: {lock}")
 
+        term = self._base_term_payload(appointment, lock)
+        term["parentReservationId"] = related_visits[0]['reservationId']
         payload = {
             "existingReservationId": related_visits[0]['reservationId'],
-            "term": {
-                "serviceVariantId": appointment['serviceId'],
-                "facilityId": appointment['clinicId'],
-                "roomId": appointment['roomId'],
-                "scheduleId": appointment['scheduleId'],
-                "date": appointment['dateTimeFrom'].astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-                "timeFrom": appointment['dateTimeFrom'].strftime("%H:%M"),
-                "doctorId": appointment['doctor']['id'],
-                "temporaryReservationId": lock['temporaryReservationId'],
-                "valuation": lock['valuations'][0],
-                "referralRequired": False,
-                "parentReservationId": related_visits[0]['reservationId']
-            }
+            "term": term
         }
 
-        reservation = self._post(self.RESERVATION_CHANGE_TERM_URL, json=payload, headers={"Content-Type": "application/json"})
+        reservation = self._post(self.RESERVATION_CHANGE_TERM_URL, json=payload)
     
         if reservation.get("errors"):
             raise LuxmedApiError(f"Error in reservation creation: {reservation['errors']}")
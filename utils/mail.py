@@ -1,5 +1,7 @@
 
+import atexit
 import smtplib
+import threading
 import requests
 import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
@@ -10,9 +12,26 @@ class MailHandler:
         logger.info("Initializing MailHandler.")
         self.config = config
 
+        # Clients are built once and reused, keeping their connections warm between sends
+        self._ses_client = None
+        self._mailgun_session = None
+        self._smtp = None
+        self._smtp_lock = threading.Lock()
+        self._dispatch = {
+            "SMTP": self._send_mail_smtp,
+            "MAILGUN": self._send_mail_mailgun,
+            "SES": self._send_mail_ses,
+        }
+        if config.get('provider') == "SES":
+            self._ses_client = boto3.Session(**config['ses'].get('session', {})).client('ses')
+        elif config.get('provider') == "MAILGUN":
+            self._mailgun_session = requests.Session()
+        elif config.get('provider') == "SMTP":
+            atexit.register(self.close)
+
     def _send_mail_mailgun(self, subject: str, message: str, recipients: str):
         mailgun_config = self.config['mailgun']
-        response = requests.post(
+        response = self._mailgun_session.post(
             f"https://api.mailgun.net/v3/{mailgun_config['domain']}/messages",
             auth=("api", mailgun_config["apikey"]),
             data={
@@ -25,27 +44,59 @@ class MailHandler:
         response.raise_for_status()
         logger.info(f"Email sent by Mailgun. Status Code: {response.status_code}, Response: {response.text}")
 
+    def _get_smtp(self) -> smtplib.SMTP:
+        """Return a logged in SMTP connection, reconnecting when the cached one went stale."""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        email_config = self.config["smtp"]
+        server = smtplib.SMTP(email_config["smtp_server"], email_config["smtp_port"])
+        server.starttls()
+        server.login(email_config["email"], email_config["password"])
+        self._smtp = server
+        return server
+
+    def _close_smtp(self):
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
     def _send_mail_smtp(self, subject: str, message: str, recipments: str):
         """Send email notifications about found appointments."""
         email_config = self.config["smtp"]
-        with smtplib.SMTP(email_config["smtp_server"], email_config["smtp_port"]) as server:
-            server.starttls()
-            server.login(email_config["email"], email_config["password"])
-            server.sendmail(
-                from_addr=email_config["email"],
-                to_addrs=recipments,
-                msg=f"Subject: {subject}\n\n{message}"
-            )
+        mail = {
+            "from_addr": email_config["email"],
+            "to_addrs": recipments,
+            "msg": f"Subject: {subject}\n\n{message}"
+        }
+        with self._smtp_lock:
+            try:
+                self._get_smtp().sendmail(**mail)
+            except smtplib.SMTPServerDisconnected:
+                # The server may drop an idle connection right after NOOP
+                self._smtp = None
+                self._get_smtp().sendmail(**mail)
         logger.info("Email notification sent.")
 
+    def close(self):
+        """Close the cached SMTP connection."""
+        with self._smtp_lock:
+            if self._smtp is not None:
+                self._close_smtp()
+
     def _send_mail_ses(self, subject: str, message: str, recipients: str):
         """Send email using AWS SES."""
         ses_config = self.config['ses']
-        session_config = ses_config.get('session', {})
-        ses_client = boto3.Session(**session_config).client('ses')
 
         try:
-            response = ses_client.send_email(
+            response = self._ses_client.send_email(
                 Source=ses_config['sender'],
                 Destination={
                     'ToAddresses': recipients.split(','),
@@ -72,13 +123,7 @@ class MailHandler:
     def send_mail(self, subject: str, message: str):
         """Send email notifications about found appointments."""
         config = self.config
-        recipients = config['recipients']
-
-        if config['provider'] == "SMTP":
-            return self._send_mail_smtp(subject, message, recipients)
-        elif config['provider'] == "MAILGUN":
-            return self._send_mail_mailgun(subject, message, recipients)
-        elif config['provider'] == "SES":
-            return self._send_mail_ses(subject, message, recipients)
-        
-        raise Exception(f"Unhandled email provider {config['provider']}")
\ No newline at end of file
+        handler = self._dispatch.get(config['provider'])
+        if handler is None:
+            raise Exception(f"Unhandled email provider {config['provider']}")
+        return handler(subject, message, config['recipients'])
\ No newline at end of file